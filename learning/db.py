@@ -1,5 +1,6 @@
 import duckdb
-from typing import Optional
+from typing import Dict, Iterator, Optional, Tuple
+import numpy as np
 
 
 # con = duckdb.connect(database = "birds.duckdb", read_only = True)
@@ -11,6 +12,24 @@ def json_query(query):
             ) row;"""
     return duckdb.sql(base.format(query)).fetchone()[0]
 
+def ndjson_query(query, params=None, batch_size: int=10000) -> Iterator[str]:
+    # Like json_query, but yields one JSON object per line, a record batch at a time,
+    # so nothing is ever fully materialized.
+    base = """SELECT to_json(row)::VARCHAR AS json_data
+            FROM (
+                {}
+            ) row"""
+    # Own connection: the default one isn't safe to share across streaming responses.
+    con = duckdb.connect()
+    try:
+        reader = con.execute(base.format(query), params or []).fetch_record_batch(batch_size)
+        for batch in reader:
+            lines = batch.column(0).to_pylist()
+            if lines:
+                yield '\n'.join(lines) + '\n'
+    finally:
+        con.close()
+
 def get_species_locations(species_name: str, limit: Optional[int]=5000):
     ls = ''
     if limit is not None:
@@ -24,4 +43,43 @@ def get_species_locations(species_name: str, limit: Optional[int]=5000):
     WHERE species = '{species}' {ls}""".format(species=species_name, 
                                                ls=ls)
 
-    return duckdb.sql(query)
\ No newline at end of file
+    return duckdb.sql(query)
+
+# Rows the density grid is built from. Shared so the bounds and the streamed
+# points always cover the same sightings.
+SPECIES_LOCATIONS_WHERE = """WHERE species = ?
+    AND decimalLatitude IS NOT NULL
+    AND decimalLongitude IS NOT NULL"""
+
+def get_species_bounds(species_name: str) -> Optional[Tuple[float, float, float, float]]:
+    # (x_min, x_max, y_min, y_max), or None if there are no sightings.
+    query = """SELECT min(decimalLatitude), max(decimalLatitude),
+    min(decimalLongitude), max(decimalLongitude)
+    FROM birds.parquet
+    {where}""".format(where=SPECIES_LOCATIONS_WHERE)
+    con = duckdb.connect()
+    try:
+        bounds = con.execute(query, [species_name]).fetchone()
+    finally:
+        con.close()
+    if bounds is None or bounds[0] is None:
+        return None
+    return bounds
+
+def stream_species_locations(species_name: str,
+                             batch_size: int=10000) -> Iterator[Dict[str, np.ndarray]]:
+    # Same columns as get_species_locations (minus t), but unlimited,
+    # yielded a record batch at a time in the fetchnumpy() layout.
+    query = """SELECT decimalLatitude AS x,
+    decimalLongitude AS y,
+    ifnull(individualCount, 1) AS z
+    FROM birds.parquet
+    {where}""".format(where=SPECIES_LOCATIONS_WHERE)
+    con = duckdb.connect()
+    try:
+        reader = con.execute(query, [species_name]).fetch_record_batch(batch_size)
+        for batch in reader:
+            yield {name: batch.column(name).to_numpy(zero_copy_only=False).astype(float)
+                   for name in batch.schema.names}
+    finally:
+        con.close()
@@ -6,7 +6,8 @@
 
 import numpy as np
 from scipy.linalg import sqrtm, det, inv
-from typing import List, Tuple, Dict
+from scipy.signal import fftconvolve
+from typing import List, Tuple, Dict, Iterable
 from learning.graph import Point
 import functools
 
@@ -143,6 +144,84 @@ class SpaceTimeKDE():
         return np.sum(space_kernel * time_kernel, axis=1) / self.n
 
 
+def make_grid(bounds: Tuple[float, float, float, float],
+              num: int = 100) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Evaluation grid shared by every density endpoint.
+    # Returns the lat axis, the lon axis, and the flattened (num*num, 2) coords (lat varies fastest).
+    x_min, x_max, y_min, y_max = bounds
+    lats = np.linspace(x_min, x_max, num=num)
+    lons = np.linspace(y_min, y_max, num=num)
+
+    lat_grid, lon_grid = np.meshgrid(lats, lons)
+    coords = np.stack((lat_grid.flatten(), lon_grid.flatten()), axis=1)
+    return lats, lons, coords
+
+
+def grid_points(coords: np.ndarray, evaluations: np.ndarray) -> np.ndarray:
+    return np.array([{'lat': lat, 'lon': lon, 'z': e} for (lat, lon), e in zip(coords, evaluations)])
+
+
+def _bin_edges(axis: np.ndarray) -> np.ndarray:
+    # Edges halfway between grid nodes, so each sample lands in its nearest node's bin.
+    step = axis[1] - axis[0] if len(axis) > 1 else 0.0
+    if step <= 0:
+        # Degenerate axis: every node sits at the same value, so any bin will do.
+        step = 1.0
+    return axis[0] + (np.arange(len(axis) + 1) - 0.5) * step
+
+
+class StreamingDensityGrid():
+    # Binned weighted KDE on the make_grid grid, fed samples a batch at a time.
+    # update() is a weighted 2D histogram onto the grid nodes, O(batch size);
+    # density() convolves that once with the kernel, O(grid) via FFT.
+    # Memory is constant in the number of samples. The price is that each sample
+    # is snapped to its nearest node, which is negligible while the grid spacing
+    # is small next to the bandwidth.
+    def __init__(self, bounds: Tuple[float, float, float, float],
+                 bandwidth_matrix: np.array,
+                 num: int = 100):
+        self.lats, self.lons, self.coords = make_grid(bounds, num)
+        self.H = bandwidth_matrix
+        self.K = phi_h(self.H)
+        self.lat_edges = _bin_edges(self.lats)
+        self.lon_edges = _bin_edges(self.lons)
+        self.counts = np.zeros((len(self.lats), len(self.lons)))
+        self.total_weights = 0.0
+
+    def update(self, samples, weights):
+        samples = np.asarray(samples)
+        weights = np.asarray(weights)
+        if len(samples) == 0:
+            return
+        counts, _, _ = np.histogram2d(samples[:, 0], samples[:, 1],
+                                      bins=[self.lat_edges, self.lon_edges],
+                                      weights=weights)
+        self.counts += counts
+        self.total_weights += float(np.sum(weights))
+
+    def density(self):
+        if self.total_weights == 0:
+            return np.zeros(len(self.coords))
+
+        # Kernel evaluated at every node-to-node offset, (2*num-1, 2*num-1).
+        n_lat, n_lon = self.counts.shape
+        lat_step = self.lats[1] - self.lats[0] if n_lat > 1 else 0.0
+        lon_step = self.lons[1] - self.lons[0] if n_lon > 1 else 0.0
+        lat_offsets = np.arange(-(n_lat - 1), n_lat) * lat_step
+        lon_offsets = np.arange(-(n_lon - 1), n_lon) * lon_step
+        lat_off_grid, lon_off_grid = np.meshgrid(lat_offsets, lon_offsets, indexing='ij')
+        offsets = np.stack((lat_off_grid.flatten(), lon_off_grid.flatten()), axis=1)
+        kernel = self.K(offsets).reshape(len(lat_offsets), len(lon_offsets))
+
+        # The middle of the full convolution is the kernel sum at each node.
+        full = fftconvolve(self.counts, kernel, mode='full')
+        sums = full[n_lat - 1:2 * n_lat - 1, n_lon - 1:2 * n_lon - 1]
+        # FFT round-off can leave tiny negatives where the density is ~0.
+        sums = np.clip(sums, 0, None)
+        # (lat, lon) indexing -> make_grid's flattened order, where lat varies fastest.
+        return sums.T.flatten() / self.total_weights
+
+
 def fit_and_calculate(sampled_points: Dict[str, np.ndarray],
                       bandwidth_matrix=None):
     # Extract coordinates from sampled points
@@ -159,18 +238,22 @@ def fit_and_calculate(sampled_points: Dict[str, np.ndarray],
                                       weights=Zs,
                                       bandwidth_matrix=0.2*np.eye(spatial_data.ndim))
     # Prediction part.
-    x_min = min(Xs)
-    x_max = max(Xs)
-    y_min = min(Ys)
-    y_max = max(Ys)
+    _, _, coords = make_grid((min(Xs), max(Xs), min(Ys), max(Ys)))
 
-    lats = np.linspace(x_min, x_max, num=100)  # 1-degree steps
-    lons = np.linspace(y_min, y_max, num=100)  # 1-degree steps
+    evaluations = KDE.kde(coords)
+    return grid_points(coords, evaluations)
 
-    lat_grid, lon_grid = np.meshgrid(lats, lons)
-    coords = np.stack((lat_grid.flatten(), lon_grid.flatten()), axis=1)
 
-    evaluations = KDE.kde(coords)
-    return np.array([{'lat': lat, 'lon': lon, 'z': e} for (lat, lon), e in zip(coords, evaluations)])
+def fit_and_calculate_streaming(batches: Iterable[Dict[str, np.ndarray]],
+                                bounds: Tuple[float, float, float, float],
+                                bandwidth_matrix=None):
+    # Like fit_and_calculate, but over an iterable of batches in the fetchnumpy() layout.
+    # The grid needs its bounds up front, since we never see all the points at once.
+    if bandwidth_matrix is None:
+        bandwidth_matrix = 0.2 * np.eye(2)
 
+    grid = StreamingDensityGrid(bounds, bandwidth_matrix)
+    for batch in batches:
+        grid.update(np.column_stack((batch['x'], batch['y'])), batch['z'])
 
+    return grid_points(grid.coords, grid.density())
@@ -1,8 +1,8 @@
-from flask import Blueprint, render_template, jsonify, request
+from flask import Blueprint, render_template, jsonify, request, Response
 from learning.graph import generate_points, Point
 from learning.learner import fit_curve, calculate_error
-from learning.db import json_query, get_species_locations
-from learning.kde import fit_and_calculate, optimize_bandwidth
+from learning.db import ndjson_query, get_species_locations, get_species_bounds, stream_species_locations
+from learning.kde import fit_and_calculate, fit_and_calculate_streaming, optimize_bandwidth
 import duckdb
 import polars as pl
 
@@ -111,15 +111,18 @@ available_birds = ['Baeolophus bicolor', 'Cyanocitta cristata', 'Sitta carolinen
 def nyc_locs():
     species = request.args.get('species', available_birds[0])
     # df = pl.read_csv("secondbirds.csv")
-    # SQL INJECTION ALERT
-    res = json_query(f"SELECT decimalLatitude, decimalLongitude, ifnull(individualCount, 1) AS individualCount FROM birds.parquet WHERE species = '{species}' LIMIT 1500")
-    return res
+    # Streamed as NDJSON, one sighting per line, so there's no need to truncate.
+    rows = ndjson_query("SELECT decimalLatitude, decimalLongitude, ifnull(individualCount, 1) AS individualCount FROM birds.parquet WHERE species = ?",
+                        [species])
+    return Response(rows, mimetype='application/x-ndjson')
 
 @bp.route('/nyc/densities', methods=['GET'])
 def nyc_kde():
     species = request.args.get('species', available_birds[0])
-    sw = get_species_locations(species).fetchnumpy()
-    K = fit_and_calculate(sw)
+    bounds = get_species_bounds(species)
+    if bounds is None:
+        return jsonify([])
+    K = fit_and_calculate_streaming(stream_species_locations(species), bounds)
     # Calculate the KDE.
     return jsonify(K.tolist())
 
@@ -1,3 +1,5 @@
+const MAX_MARKERS = 5000;
+
 class NYCMap {
     constructor() {
         this.base_layout = {
@@ -27,22 +29,52 @@ class NYCMap {
         });
     }
 
-    async loadLocations() {
+    async streamLocations() {
+        // Plots the NDJSON rows as they arrive, up to MAX_MARKERS.
+        // The density layer covers every sighting; past the cap, more markers only slow Plotly down.
         const loadingDiv = document.getElementById('loading');
 
         loadingDiv.style.display = 'block';
+        let reader = null;
         try {
             const response = await fetch('/nyc/locs');
             if (!response.ok) {
                 throw new Error('Network response was not ok');
             }
-            const locations = await response.json();
-            return locations;
+            reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let plotted = 0;
+            while (plotted < MAX_MARKERS) {
+                const { done, value } = await reader.read();
+                if (!done) {
+                    buffer += decoder.decode(value, { stream: true });
+                }
+                const lines = buffer.split('\n');
+                buffer = done ? '' : lines.pop();
+                const locations = lines.filter(line => line)
+                                       .slice(0, MAX_MARKERS - plotted)
+                                       .map(line => JSON.parse(line));
+                if (locations.length > 0) {
+                    Plotly.extendTraces('nycMap', {
+                        lat: [locations.map(loc => loc.decimalLatitude)],
+                        lon: [locations.map(loc => loc.decimalLongitude)],
+                        text: [locations.map(loc => loc.individualCount)]
+                    }, [0]);
+                    plotted += locations.length;
+                    // First markers are up, no need to keep the spinner.
+                    loadingDiv.style.display = 'none';
+                }
+                if (done) break;
+            }
         } catch (error) {
             console.error('Error loading locations:', error);
             alert('Error loading locations. Please try again.');
-            return [];
         } finally {
+            if (reader) {
+                // Stops the server streaming rows we won't draw.
+                reader.cancel().catch(() => {});
+            }
             loadingDiv.style.display = 'none';
         }
     }
@@ -63,23 +95,27 @@ class NYCMap {
     }
 
     async fetchAndUpdatePlot() {
-        const locations = await this.loadLocations();
-        const densities = await this.loadDensities();
-
-        const data = [{
+        const markers = {
             type: 'scattermap',
-            lat: locations.map(loc => loc.decimalLatitude),
-            lon: locations.map(loc => loc.decimalLongitude),
+            lat: [],
+            lon: [],
             mode: 'markers',
             marker: {
                 size: 3,
                 opacity: 0.5,
                 color: 'white'
             },
-            z: locations.map(loc => loc.individualCount),
-            text: locations.map(loc => loc.individualCount),
+            text: [],
             hoverinfo: 'text'
-        }, {
+        };
+        await Plotly.react('nycMap', [markers], this.base_layout);
+
+        // Densities are computed server-side while the markers stream in.
+        const densitiesPromise = this.loadDensities();
+        await this.streamLocations();
+        const densities = await densitiesPromise;
+
+        Plotly.addTraces('nycMap', {
             type: 'densitymap',
             lat: densities.map(loc => loc.lat),
             lon: densities.map(loc => loc.lon),
@@ -87,9 +123,7 @@ class NYCMap {
             colorscale: 'Portland',
             radius: 25,
             opacity: 0.2
-        }];
-
-    Plotly.react('nycMap', data, this.base_layout);
+        });
     }
 }
 
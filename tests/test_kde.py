@@ -0,0 +1,87 @@
+import numpy as np
+from learning.kde import (StreamingDensityGrid, WeightedMultidimensionalKDE,
+                          fit_and_calculate, fit_and_calculate_streaming, make_grid)
+
+
+H = 0.2 * np.eye(2)
+# Binning snaps samples to nodes ~0.015 apart against a ~0.45 bandwidth,
+# which is off by ~0.1% at worst here.
+BINNING_RTOL = 5e-3
+
+
+def make_samples(n: int = 1001, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    samples = np.column_stack((rng.uniform(40.0, 41.5, n),
+                               rng.uniform(-74.5, -73.0, n)))
+    weights = rng.integers(1, 10, n).astype(float)
+    return samples, weights
+
+
+def bounds_of(samples):
+    return (samples[:, 0].min(), samples[:, 0].max(),
+            samples[:, 1].min(), samples[:, 1].max())
+
+
+def exact_density(samples, weights, coords):
+    return WeightedMultidimensionalKDE(samples, weights, H).kde(coords)
+
+
+def test_single_batch_matches_exact_kde():
+    samples, weights = make_samples()
+    grid = StreamingDensityGrid(bounds_of(samples), H)
+    grid.update(samples, weights)
+
+    expected = exact_density(samples, weights, grid.coords)
+    assert np.allclose(grid.density(), expected, rtol=BINNING_RTOL, atol=1e-6)
+
+
+def test_batches_match_single_batch():
+    samples, weights = make_samples()
+    whole = StreamingDensityGrid(bounds_of(samples), H)
+    whole.update(samples, weights)
+
+    split = StreamingDensityGrid(bounds_of(samples), H)
+    # Uneven batch sizes that don't divide N, including an empty one.
+    for idx in np.array_split(np.arange(len(samples)), [7, 7, 300, 777]):
+        split.update(samples[idx], weights[idx])
+
+    assert np.allclose(split.density(), whole.density())
+    assert np.allclose(split.density(), exact_density(samples, weights, split.coords),
+                       rtol=BINNING_RTOL, atol=1e-6)
+
+
+def test_streaming_matches_fit_and_calculate():
+    samples, weights = make_samples(n=300)
+    sampled = {'x': samples[:, 0], 'y': samples[:, 1],
+               't': np.zeros(len(samples)), 'z': weights}
+    batches = [{k: v[i:i + 64] for k, v in sampled.items()}
+               for i in range(0, len(samples), 64)]
+
+    expected = fit_and_calculate(sampled)
+    result = fit_and_calculate_streaming(batches, bounds_of(samples))
+
+    assert [(p['lat'], p['lon']) for p in result] == [(p['lat'], p['lon']) for p in expected]
+    assert np.allclose([p['z'] for p in result], [p['z'] for p in expected],
+                       rtol=BINNING_RTOL, atol=1e-6)
+
+
+def test_degenerate_bounds():
+    samples = np.array([[40.7, -73.9], [40.7, -73.9]])
+    weights = np.array([1.0, 3.0])
+    grid = StreamingDensityGrid(bounds_of(samples), H)
+    grid.update(samples, weights)
+
+    assert np.allclose(grid.density(), exact_density(samples, weights, grid.coords))
+
+
+def test_empty_and_zero_weight_density():
+    bounds = (40.0, 41.0, -74.0, -73.0)
+    _, _, coords = make_grid(bounds)
+
+    empty = StreamingDensityGrid(bounds, H)
+    empty.update(np.empty((0, 2)), np.empty(0))
+    assert np.array_equal(empty.density(), np.zeros(len(coords)))
+
+    zero_weight = StreamingDensityGrid(bounds, H)
+    zero_weight.update(np.array([[40.5, -73.5]]), np.array([0.0]))
+    assert np.array_equal(zero_weight.density(), np.zeros(len(coords)))